@@ -1,21 +1,45 @@
 from argparse import ArgumentParser
 from bisect import insort
 from dataclasses import dataclass, replace
-from json import loads, dump
 from html.parser import HTMLParser
-from typing import Any, Callable, Dict, List, Tuple, TypeVar
-from aiohttp import ClientSession
-from asyncio import run, gather, sleep
+from re import compile as compile_regex
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, TypeVar
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+from asyncio import gather, get_running_loop, Semaphore, to_thread
+from collections.abc import Awaitable
+from concurrent.futures import Executor, ProcessPoolExecutor
+from hashlib import blake2b
+from orjson import loads, dumps
+from pathlib import Path
+from uuid import uuid4
+
+try:
+    from uvloop import run
+except ImportError:
+    from asyncio import run
 
 # constants
 POST_LINK_ID = "f4706281-cc60-4ff0-a0b6-b803683cc24b"
+MAX_CONCURRENT_REQUESTS = 16
+# bump whenever DiscourseHTMLParser's output changes, so that cached parse
+# results from older versions are ignored
+PARSER_VERSION = 1
+# DiscourseHTMLParser only changes the meaning of html containing links
+# (and, through "<a", asides and articles), code blocks or character
+# references, including their end tags. Html without any of these is passed
+# through as-is; the parser would only have re-serialized it, normalizing
+# self-closing "/>" to " />", lowercasing tag names and writing valueless
+# attributes as ="None"
+PARSER_TRIGGERS = compile_regex(r"(?i)</?(?:a|pre)|&")
+DISCOURSE_TOPIC_LINK = compile_regex(r"https://discuss\.hail\.is/t/([^/]+)")
 
 # types
 CallbackResponse = TypeVar("CallbackResponse")
 Callback = Callable[[Dict[str, Any]], CallbackResponse]
+T = TypeVar("T")
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class DiscoursePost:
     id: int
     topic_id: int
@@ -23,7 +47,7 @@ class DiscoursePost:
     html: str
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class DiscourseTopic:
     id: int
     slug: str
@@ -35,7 +59,7 @@ class DiscourseTopic:
 class DiscourseHTMLParser(HTMLParser):
     def __init__(self: "DiscourseHTMLParser") -> None:
         super().__init__()
-        self.output_html = ""
+        self._chunks = []
         self.post_links = set()
         # relative file links starting with /
         self.relative_link = False
@@ -52,64 +76,157 @@ class DiscourseHTMLParser(HTMLParser):
         # @ mentions
         self.mention = False
 
+    @property
+    def output_html(self: "DiscourseHTMLParser") -> str:
+        output_html = "".join(self._chunks)
+        self._chunks = [output_html]
+        return output_html
+
     def _decl_handler(self: "DiscourseHTMLParser", decl: str) -> None:
-        self.output_html += f"<!{decl}>"
+        self._chunks.append(f"<!{decl}>")
 
     def _ref_handler(self: "DiscourseHTMLParser", name: str) -> None:
-        self.output_html += f"&{name};"
+        self._chunks.append(f"&{name};")
 
     def _write_starttag(
         self: "DiscourseHTMLParser", attrs: List[Tuple[str, str]], tag: str, suffix: str
     ) -> None:
         attr_str_prefix = " " if len(attrs) > 0 else ""
         attr_str = " ".join([f'{key}="{value}"' for key, value in attrs])
-        self.output_html += f"<{tag}{attr_str_prefix}{attr_str}{suffix}>"
+        self._chunks.append(f"<{tag}{attr_str_prefix}{attr_str}{suffix}>")
+
+    def _start_a(
+        self: "DiscourseHTMLParser",
+        tag: str,
+        attrs: List[Tuple[str, str]],
+        suffix: str,
+    ) -> None:
+        if (not self.aside) or self.aside_header:
+            if self.aside_header and not self.aside_header_link_written:
+                self.aside_header_link = True
+            link = ""
+            css_class = ""
+            for key, value in attrs:
+                # valueless attributes come through as None
+                if key == "href":
+                    link = value or ""
+                elif key == "class":
+                    css_class = value or ""
+            if "mention" in css_class:
+                self.mention = True
+            elif link.startswith("/"):
+                self.relative_link = True
+            elif (topic_link := DISCOURSE_TOPIC_LINK.match(link)) is not None:
+                slug = topic_link[1]
+                self.post_links.add(slug)
+                self._chunks.append(f'<a href="{POST_LINK_ID}/{slug}">')
+            else:
+                self._write_starttag(attrs, tag, suffix)
+
+    def _start_aside(
+        self: "DiscourseHTMLParser",
+        tag: str,
+        attrs: List[Tuple[str, str]],
+        suffix: str,
+    ) -> None:
+        if not self.aside:
+            self.aside = True
+            onebox_src = get_attr(attrs, "data-onebox-src")
+            if onebox_src is not None:
+                self.aside_src = onebox_src
+                self._chunks.append(f'\n<a href="{onebox_src}">')
+
+    def _start_aside_header(
+        self: "DiscourseHTMLParser",
+        tag: str,
+        attrs: List[Tuple[str, str]],
+        suffix: str,
+    ) -> None:
+        if self.aside and self.aside_src is None:
+            self.aside_header = True
+            self._chunks.append("\n")
+        else:
+            self._start_other(tag, attrs, suffix)
+
+    def _start_div(
+        self: "DiscourseHTMLParser",
+        tag: str,
+        attrs: List[Tuple[str, str]],
+        suffix: str,
+    ) -> None:
+        # valueless attributes come through as None
+        if (
+            self.aside
+            and self.aside_src is None
+            and "title" in (get_attr(attrs, "class") or "")
+        ):
+            self._start_aside_header(tag, attrs, suffix)
+        else:
+            self._start_other(tag, attrs, suffix)
+
+    def _start_blockquote(
+        self: "DiscourseHTMLParser",
+        tag: str,
+        attrs: List[Tuple[str, str]],
+        suffix: str,
+    ) -> None:
+        if self.aside_header:
+            self.aside = False
+            self.aside_header = False
+            self.aside_header_link_written = False
+            self._write_starttag(attrs, tag, suffix)
+        else:
+            self._start_other(tag, attrs, suffix)
+
+    def _start_article(
+        self: "DiscourseHTMLParser",
+        tag: str,
+        attrs: List[Tuple[str, str]],
+        suffix: str,
+    ) -> None:
+        if self.aside_header:
+            self.aside_header = False
+            self.aside_header_link_written = False
+        else:
+            self._start_other(tag, attrs, suffix)
+
+    def _start_pre(
+        self: "DiscourseHTMLParser",
+        tag: str,
+        attrs: List[Tuple[str, str]],
+        suffix: str,
+    ) -> None:
+        if not self.aside:
+            self.code_block_pre = True
+
+    def _start_code(
+        self: "DiscourseHTMLParser",
+        tag: str,
+        attrs: List[Tuple[str, str]],
+        suffix: str,
+    ) -> None:
+        if self.code_block_pre and not self.aside:
+            self._chunks.append("\n\n```python\n")
+            self.code_block_code = True
+        else:
+            self._start_other(tag, attrs, suffix)
+
+    def _start_other(
+        self: "DiscourseHTMLParser",
+        tag: str,
+        attrs: List[Tuple[str, str]],
+        suffix: str,
+    ) -> None:
+        if not (self.aside or self.code_block_pre):
+            self._write_starttag(attrs, tag, suffix)
 
     def _starttag_handler(suffix: str = "") -> None:
         def inner(
             self: "DiscourseHTMLParser", tag: str, attrs: List[Tuple[str, str]]
         ) -> None:
-            attr_dict = dict(attrs)
-            if ((not self.aside) or self.aside_header) and tag == "a":
-                if self.aside_header and not self.aside_header_link_written:
-                    self.aside_header_link = True
-                link = attr_dict.get("href", "")
-                if "mention" in attr_dict.get("class", ""):
-                    self.mention = True
-                elif link.startswith("/"):
-                    self.relative_link = True
-                elif "https://discuss.hail.is/t/" in link:
-                    slug = link.removeprefix("https://discuss.hail.is/t/").split("/")[0]
-                    self.post_links.add(slug)
-                    self.output_html += f'<a href="{POST_LINK_ID}/{slug}">'
-                else:
-                    self._write_starttag(attrs, tag, suffix)
-            elif self.aside and self.aside_src is None and (tag == "header" or (tag == "div" and "title" in attr_dict.get("class", ""))):
-                self.aside_header = True
-                self.output_html += "\n"
-            elif self.aside_header and tag == "blockquote":
-                self.aside = False
-                self.aside_header = False
-                self.aside_header_link_written = False
-                self._write_starttag(attrs, tag, suffix)
-            elif self.aside_header and tag == "article":
-                self.aside_header = False
-                self.aside_header_link_written = False
-            elif not self.aside:
-                if tag == "aside":
-                    self.aside = True
-                    onebox_src = attr_dict.get("data-onebox-src", None)
-                    if onebox_src is not None:
-                        self.aside_src = onebox_src
-                        self.output_html += f'\n<a href="{onebox_src}">'
-                elif tag == "pre":
-                    self.code_block_pre = True
-                elif self.code_block_pre:
-                    if tag == "code":
-                        self.output_html += "\n\n```python\n"
-                        self.code_block_code = True
-                else:
-                    self._write_starttag(attrs, tag, suffix)
+            START_TAG_HANDLERS.get(tag, DiscourseHTMLParser._start_other)(
+                self, tag, attrs, suffix
+            )
 
         return inner
 
@@ -121,19 +238,19 @@ class DiscourseHTMLParser(HTMLParser):
     unknown_decl = _decl_handler
 
     def handle_comment(self: "DiscourseHTMLParser", data: str) -> None:
-        self.output_html += f"<!--{data}-->"
+        self._chunks.append(f"<!--{data}-->")
 
     def handle_data(self: "DiscourseHTMLParser", data: str) -> None:
         if self.mention:
-            self.output_html += f'{data.partition("@")[2]}'
+            self._chunks.append(f'{data.partition("@")[2]}')
         elif self.aside_src is not None and not self.aside_src_written:
-            self.output_html += self.aside_src
+            self._chunks.append(self.aside_src)
             self.aside_src_written = True
         elif (not self.aside) or self.aside_header_link:
-            self.output_html += data
+            self._chunks.append(data)
 
-    def handle_endtag(self: "DiscourseHTMLParser", tag: str) -> None:
-        if ((not self.aside) or self.aside_header) and tag == "a":
+    def _end_a(self: "DiscourseHTMLParser", tag: str) -> None:
+        if (not self.aside) or self.aside_header:
             if self.mention:
                 self.mention = False
             elif self.relative_link:
@@ -142,113 +259,193 @@ class DiscourseHTMLParser(HTMLParser):
                 if self.aside_header_link:
                     self.aside_header_link = False
                     self.aside_header_link_written = True
-                self.output_html += "</a>"
-        elif tag == "aside":
-            self.aside = False
-            if self.aside_src is not None:
-                self.output_html += "</a>\n"
-                self.aside_src = None
-                self.aside_src_written = False
-                self.aside_header_link_written = True
-        elif not self.aside:
-            if tag == "pre":
-                self.code_block_pre = False
-            elif self.code_block_pre:
-                if tag == "code":
-                    self.output_html += "\n```\n\n"
-                    self.code_block_code = False
-            else:
-                self.output_html += f"</{tag}>"
+                self._chunks.append("</a>")
+
+    def _end_aside(self: "DiscourseHTMLParser", tag: str) -> None:
+        self.aside = False
+        if self.aside_src is not None:
+            self._chunks.append("</a>\n")
+            self.aside_src = None
+            self.aside_src_written = False
+            self.aside_header_link_written = True
+
+    def _end_pre(self: "DiscourseHTMLParser", tag: str) -> None:
+        if not self.aside:
+            self.code_block_pre = False
+
+    def _end_code(self: "DiscourseHTMLParser", tag: str) -> None:
+        if self.code_block_pre and not self.aside:
+            self._chunks.append("\n```\n\n")
+            self.code_block_code = False
+        else:
+            self._end_other(tag)
+
+    def _end_other(self: "DiscourseHTMLParser", tag: str) -> None:
+        if not (self.aside or self.code_block_pre):
+            self._chunks.append(f"</{tag}>")
+
+    def handle_endtag(self: "DiscourseHTMLParser", tag: str) -> None:
+        END_TAG_HANDLERS.get(tag, DiscourseHTMLParser._end_other)(self, tag)
 
     def handle_pi(self: "DiscourseHTMLParser", data: str) -> None:
-        self.output_html += f"<?{data}>"
+        self._chunks.append(f"<?{data}>")
+
+
+# tag-specific behavior, looked up once per tag instead of walking a chain of
+# conditions; tags without an entry get the _start_other/_end_other behavior
+START_TAG_HANDLERS = {
+    "a": DiscourseHTMLParser._start_a,
+    "article": DiscourseHTMLParser._start_article,
+    "aside": DiscourseHTMLParser._start_aside,
+    "blockquote": DiscourseHTMLParser._start_blockquote,
+    "code": DiscourseHTMLParser._start_code,
+    "div": DiscourseHTMLParser._start_div,
+    "header": DiscourseHTMLParser._start_aside_header,
+    "pre": DiscourseHTMLParser._start_pre,
+}
+END_TAG_HANDLERS = {
+    "a": DiscourseHTMLParser._end_a,
+    "aside": DiscourseHTMLParser._end_aside,
+    "code": DiscourseHTMLParser._end_code,
+    "pre": DiscourseHTMLParser._end_pre,
+}
+
+
+def get_attr(attrs: List[Tuple[str, str]], name: str, default: Any = None) -> Any:
+    # like dict(attrs).get(name, default), where the last duplicate wins
+    value = default
+    for key, attr_value in attrs:
+        if key == name:
+            value = attr_value
+    return value
+
+
+def parse_post_html(html: str) -> Tuple[str, Set[str]]:
+    parser = DiscourseHTMLParser()
+    parser.feed(html)
+    return parser.output_html, parser.post_links
 
 
 # main script
-async def main(discourse_page: int, github_token: str) -> None:
-    async with ClientSession() as session:
-        pages = await run_tasks(
-            [parse_page(page, session) for page in range(discourse_page + 1)]
+async def main(
+    discourse_page: int, github_token: str, cache_dir: Optional[Path] = None
+) -> None:
+    if cache_dir is not None:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+    connector = TCPConnector(
+        limit=32,
+        limit_per_host=MAX_CONCURRENT_REQUESTS,
+        ttl_dns_cache=300,
+        keepalive_timeout=60,
+    )
+    async with ClientSession(
+        connector=connector, timeout=ClientTimeout(total=30)
+    ) as session:
+        semaphore = Semaphore(MAX_CONCURRENT_REQUESTS)
+        pages = await gather(
+            *[
+                bounded(parse_page(page, session), semaphore)
+                for page in range(discourse_page + 1)
+            ]
         )
-        topics = await run_tasks(
-            [
-                parse_topic(topic["id"], session)
+        topics = await gather(
+            *[
+                bounded(parse_topic(topic["id"], session), semaphore)
                 for page in pages
                 for topic in page["topic_list"]["topics"]
             ]
         )
-        posts = await run_tasks(
-            [
-                parse_post(post["id"], session)
-                for topic in topics
-                for post in topic["post_stream"]["posts"]
-            ]
-        )
-
-        topic_acc = {topic["id"]: {"fields": topic, "posts": []} for topic in topics}
-        for post in posts:
-            topic_acc[post.topic_id]["posts"].append(post)
 
         # links = {}
-        topics = []
-        for topic_id, topic in topic_acc.items():
-            if topic["fields"]["slug"] != "welcome-to-the-hail-community":
-                topic_html = ""
-                # links[topic["fields"]["slug"]] = {"idx": -1, "dests": set()}
-                for post in topic["posts"]:
-                    parser = DiscourseHTMLParser()
-                    parser.feed(post.html)
-                    topic_html += (
-                        f"<h2>{post.username} said:</h2>\n{parser.output_html}\n\n"
-                    )
-                    # links[topic["fields"]["slug"]]["dests"] |= parser.post_links
-                with open(f'./discourse-export/{topic["fields"]["id"]}_{topic["fields"]["slug"]}.json', 'w') as file:
-                    dump({
-                        "id": topic["fields"]["id"],
-                        "slug": topic["fields"]["slug"],
-                        "title": topic["fields"]["title"],
-                        "html": topic_html,
-                    }, file)
-                # insort(
-                #     topics,
-                #     DiscourseTopic(
-                #         topic["fields"]["id"],
-                #         topic["fields"]["slug"],
-                #         topic["fields"]["title"],
-                #         topic_html,
-                #     ),
-                #     key=lambda topic: topic.id,
-                # )
-
-        # for idx, topic in enumerate(topics):
-            # links[topic.slug]["idx"] = idx
+        # issue_topics = []
+
+        # each topic is downloaded, parsed and written on its own, so parsing
+        # overlaps with other topics' downloads; once a topic's export has
+        # been written only its id, slug and outgoing links are kept
+        with ProcessPoolExecutor() as pool:
+            exported_topics = await gather(
+                *[
+                    export_topic(topic, session, semaphore, pool, cache_dir)
+                    for topic in topics
+                    if topic["slug"] != "welcome-to-the-hail-community"
+                ]
+            )
+
+        # for topic_id, topic_slug, topic_links in exported_topics:
+        #     links[topic_slug] = {"idx": -1, "dests": topic_links}
+        #     insort(issue_topics, (topic_id, topic_slug))
+
+        # for idx, (topic_id, topic_slug) in enumerate(issue_topics):
+        #     links[topic_slug]["idx"] = idx
+
+        # topic html is read back from the exports one topic at a time, so it
+        # never has to be held in memory for every topic at once
+        # def load_topic(topic_id, topic_slug):
+        #     with open(f"./discourse-export/{topic_id}_{topic_slug}.json", "rb") as file:
+        #         return DiscourseTopic(**loads(file.read()))
 
         # first_issue_id = int((
-        #     await run_tasks([create_issue(topics[0], session, github_token)])
-        # )[0]["number"])
-
-        # for src, data in links.items():
-        #     if len(data["dests"]) != 0:
-        #         for dest in data["dests"]:
-        #             dest_data = links.get(dest, None)
-        #             if dest_data is None:
-        #                 print(
-        #                     f"broken link: {src}->{dest} (https://github.com/iris-garden/test-process/issues/{first_issue_id + data['idx']})"
-        #                 )
-        #             else:
-        #                 topic = topics[data["idx"]]
-        #                 topics[data["idx"]] = replace(
-        #                     topic,
-        #                     html=topic.html.replace(
-        #                         f"{POST_LINK_ID}/{dest}",
-        #                         f"https://github.com/iris-garden/test-process/issues/{first_issue_id + dest_data['idx']}",
-        #                     )
+        #     await bounded(create_issue(load_topic(*issue_topics[0]), session, github_token), semaphore)
+        # )["number"])
+
+        # def rewrite_links(topic):
+        #     data = links[topic.slug]
+        #     for dest in data["dests"]:
+        #         dest_data = links.get(dest, None)
+        #         if dest_data is None:
+        #             print(
+        #                 f"broken link: {topic.slug}->{dest} (https://github.com/iris-garden/test-process/issues/{first_issue_id + data['idx']})"
+        #             )
+        #         else:
+        #             topic = replace(
+        #                 topic,
+        #                 html=topic.html.replace(
+        #                     f"{POST_LINK_ID}/{dest}",
+        #                     f"https://github.com/iris-garden/test-process/issues/{first_issue_id + dest_data['idx']}",
         #                 )
+        #             )
+        #     return topic
 
         # TODO split this into a download script and an upload script, save all to files, build up links as a separate step, upload in order one at a time
-        # await run_tasks(
-        #     [create_issue(topic, session, github_token) for topic in topics[1:]]
-        # )
+        # for topic_id, topic_slug in issue_topics[1:]:
+        #     await create_issue(
+        #         rewrite_links(load_topic(topic_id, topic_slug)), session, github_token
+        #     )
+
+async def export_topic(
+    topic: Dict[str, Any],
+    session: ClientSession,
+    semaphore: Semaphore,
+    pool: Executor,
+    cache_dir: Optional[Path] = None,
+) -> Tuple[int, str, Set[str]]:
+    posts = await gather(
+        *[
+            bounded(
+                parse_post(post["id"], session, cache_dir, post["updated_at"]),
+                semaphore,
+            )
+            for post in topic["posts"]
+        ]
+    )
+    # html parsing is cpu-bound, so spread it across processes
+    parsed_posts = await gather(
+        *[parse_post_html_cached(post.html, pool, cache_dir) for post in posts]
+    )
+
+    topic_html = []
+    topic_links = set()
+    for post, (post_html, post_links) in zip(posts, parsed_posts):
+        topic_html.append(f"<h2>{post.username} said:</h2>\n{post_html}\n\n")
+        topic_links |= post_links
+    discourse_topic = DiscourseTopic(
+        topic["id"], topic["slug"], topic["title"], "".join(topic_html)
+    )
+    await write_json(
+        Path(f"./discourse-export/{discourse_topic.id}_{discourse_topic.slug}.json"),
+        discourse_topic,
+    )
+    return discourse_topic.id, discourse_topic.slug, topic_links
 
 
 async def create_issue(
@@ -267,45 +464,131 @@ async def create_issue(
         return loads(await response.read())
 
 
-async def run_tasks(tasks):
-    result = []
-    while len(tasks) != 0:
-        if len(tasks) > 5:
-            result += await gather(*tasks[:4])
-            tasks = tasks[4:]
-            await sleep(2)
-        else:
-            result += await gather(*tasks)
-            tasks = []
-    return result
+async def bounded(task: Awaitable[T], semaphore: Semaphore) -> T:
+    async with semaphore:
+        return await task
+
+
+def read_if_exists(path: Path) -> Optional[bytes]:
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def write_atomic(path: Path, body: bytes) -> None:
+    # the partial file is unique per write, since two posts with identical
+    # html can write the same cache entry concurrently
+    partial_path = path.with_name(f"{path.name}.{uuid4().hex}.partial")
+    partial_path.write_bytes(body)
+    partial_path.replace(path)
+
+
+async def parse_post_html_cached(
+    html: str, pool: Executor, cache_dir: Optional[Path] = None
+) -> Tuple[str, Set[str]]:
+    if PARSER_TRIGGERS.search(html) is None:
+        return html, set()
+    # parse results are keyed by the post html itself, so an unchanged post
+    # is never parsed twice and a changed one never hits a stale entry
+    cache_file = None
+    if cache_dir is not None:
+        digest = blake2b(
+            f"{PARSER_VERSION}:{html}".encode(), digest_size=16
+        ).hexdigest()
+        cache_file = cache_dir / f"html_{digest}.json"
+        cached = await to_thread(read_if_exists, cache_file)
+        if cached is not None:
+            output_html, post_links = loads(cached)
+            return output_html, set(post_links)
+    output_html, post_links = await get_running_loop().run_in_executor(
+        pool, parse_post_html, html
+    )
+    if cache_file is not None:
+        await to_thread(
+            write_atomic, cache_file, dumps([output_html, sorted(post_links)])
+        )
+    return output_html, post_links
+
+
+async def write_json(path: Path, data: Any) -> None:
+    await to_thread(path.write_bytes, dumps(data))
 
 
 async def parse_page(discourse_page: int, session: ClientSession) -> None:
     async with session.get(
         f"https://discuss.hail.is/latest.json?page={discourse_page}"
     ) as response:
-        return await response.json()
+        return loads(await response.read())
 
 
-async def parse_topic(topic_id: int, session: ClientSession) -> None:
-    async with session.get(f"https://discuss.hail.is/t/{topic_id}.json") as response:
-        return loads(await response.read())
+async def fetch_json(
+    url: str,
+    session: ClientSession,
+    cache_file: Optional[Path] = None,
+    version_key: Optional[str] = None,
+    version: Any = None,
+) -> Dict[str, Any]:
+    # a cached response is reused as long as its version_key field still
+    # matches the version reported by the fresh response that led us to it
+    if cache_file is not None:
+        cached = await to_thread(read_if_exists, cache_file)
+        if cached is not None:
+            cached_json = loads(cached)
+            if version_key is None or cached_json.get(version_key) == version:
+                return cached_json
+    async with session.get(url) as response:
+        body = await response.read()
+        if cache_file is not None and response.status == 200:
+            await to_thread(write_atomic, cache_file, body)
+        return loads(body)
 
 
-async def parse_post(post_id: int, session: ClientSession) -> None:
-    async with session.get(f"https://discuss.hail.is/posts/{post_id}.json") as response:
-        response_json = loads(await response.read())
-        return DiscoursePost(
-            response_json["id"],
-            response_json["topic_id"],
-            response_json["username"],
-            response_json["cooked"],
-        )
+async def parse_topic(topic_id: int, session: ClientSession) -> None:
+    # topics are never cached: editing a post does not change anything in the
+    # topic listing, so only a fresh topic carries each post's current
+    # updated_at for parse_post to validate its cache against
+    response_json = await fetch_json(
+        f"https://discuss.hail.is/t/{topic_id}.json", session
+    )
+    # the full topic embeds the cooked html of its first posts, which are
+    # fetched again individually, so only keep what main needs
+    return {
+        "id": response_json["id"],
+        "slug": response_json["slug"],
+        "title": response_json["title"],
+        "posts": [
+            {"id": post["id"], "updated_at": post["updated_at"]}
+            for post in response_json["post_stream"]["posts"]
+        ],
+    }
+
+
+async def parse_post(
+    post_id: int,
+    session: ClientSession,
+    cache_dir: Optional[Path] = None,
+    updated_at: Optional[str] = None,
+) -> None:
+    response_json = await fetch_json(
+        f"https://discuss.hail.is/posts/{post_id}.json",
+        session,
+        None if cache_dir is None else cache_dir / f"post_{post_id}.json",
+        "updated_at",
+        updated_at,
+    )
+    return DiscoursePost(
+        response_json["id"],
+        response_json["topic_id"],
+        response_json["username"],
+        response_json["cooked"],
+    )
 
 
 if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument("--page")
     parser.add_argument("--github_token")
+    parser.add_argument("--cache_dir", type=Path)
     args = parser.parse_args()
-    run(main(int(args.page), args.github_token))
+    run(main(int(args.page), args.github_token, args.cache_dir))